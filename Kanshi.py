@@ -1,29 +1,45 @@
-from flask import Flask, render_template, flash, jsonify
-import pandas as pd
-from datetime import datetime, time, timedelta
+from flask import Flask, render_template, jsonify, request
+from datetime import datetime, timedelta
 import os
-import json
+import math
 import sqlite3
-from contextlib import closing
-from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
+import fcntl
+import threading
+from db_pool import ConnectionPool
+import timeline_pyramid
+import raw_capture
+import live_channel
+from bisect import bisect_right
 
-print("Kanshi.py web interface started")
-print(f"Current working directory: {__import__('os').getcwd()}")
+DATABASE_FILE = os.environ.get('KANSHI_DATABASE', '/home/reigicad/KoukiKanshi/machine_monitoring.db')
+# Dashboard timeline: 06:00-18:00 in 5-minute slots
+SLOT_INTERVAL = timedelta(minutes=5)
+TIMELINE_SLOTS = 144
+# /api/timeline: slots to aim for when no resolution is given, and hard limit
+TIMELINE_TARGET_SLOTS = 144
+TIMELINE_MAX_SLOTS = 2000
+SCHEDULER_LOCK_FILE = os.path.join(os.path.dirname(DATABASE_FILE), 'kanshi_scheduler.lock')
 
-DATABASE_FILE = '/home/reigicad/KoukiKanshi/machine_monitoring.db'
+# Read-only connection pool for request handlers; resets use its writer
+db = ConnectionPool(DATABASE_FILE)
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+# Shared across workers so flashed messages survive being served by another process
+app.secret_key = os.environ.get('KANSHI_SECRET_KEY') or os.urandom(24)
 
-# Initialize scheduler with timezone
-scheduler = BackgroundScheduler(timezone='Asia/Tokyo')
+# The scheduler is only created and started in the process that wins the
+# scheduler lock (see start_scheduler), so other workers never import it.
+scheduler = None
+scheduler_leader = False
+_scheduler_lock_file = None
+_scheduler_election_started = False
 
 def reset_all_machine_counters():
     """Reset counters for all machines at 6 AM."""
     print("reset_all_machine_counters function called")
     try:
-        with closing(get_db_connection()) as conn:
+        with db.write_connection() as conn:
             cursor = conn.cursor()
             now = datetime.now()
             reset_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
@@ -45,24 +61,95 @@ def reset_all_machine_counters():
                     WHERE machine_id = ?
                 """, (reset_time.isoformat(), reset_time.isoformat(), machine_id))
             
-            conn.commit()
             print(f"Reset performed at {now}, reset_time set to {reset_time}")
-            return True
             
     except sqlite3.Error as e:
         error_msg = f"Error resetting daily counters: {e}"
         print(error_msg)
         return False
 
-print("Setting up scheduler...")  # Server-side log
-# Schedule the reset job to run at 15:30 every day
-scheduler.add_job(reset_all_machine_counters, 'cron', hour=6, minute=0)
-scheduler.start()
-print(f"Scheduler started at {datetime.now()}. Next reset scheduled for 06:00")
-print("Active jobs:", scheduler.get_jobs())  # Server-side log
+    # Workers serving from memory must drop their pre-reset totals: this one
+    # reloads now, the others when the collector relays the reset message
+    try:
+        if live_state.ready:
+            live_state.load()
+    except sqlite3.Error as e:
+        live_state.ready = False
+        print(f"Error reloading live state after reset: {e}")
+    live_subscriber.send({"type": "reset"})
+    return True
+
+def _acquire_scheduler_lock():
+    """Block until this process holds the scheduler lock, then start the scheduler.
+
+    Only one process (gunicorn worker or dev server) may run the daily reset job.
+    The lock is released by the OS when the owning process exits, at which point
+    one of the waiting workers takes over.
+    """
+    global scheduler, scheduler_leader, _scheduler_lock_file
+    try:
+        lock_file = open(SCHEDULER_LOCK_FILE, 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except OSError as e:
+        app.logger.error(f"Could not acquire scheduler lock {SCHEDULER_LOCK_FILE}: {e}")
+        return
+
+    # Keep the file object alive for the lifetime of the process
+    _scheduler_lock_file = lock_file
+    scheduler_leader = True
+    # Record the leader's pid for debug_info in every worker
+    try:
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+    except OSError as e:
+        app.logger.error(f"Could not write scheduler lock {SCHEDULER_LOCK_FILE}: {e}")
+
+    print(f"Setting up scheduler in process {os.getpid()}...")  # Server-side log
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler(timezone='Asia/Tokyo')
+    scheduler.start()
+    # Schedule the reset job to run at 06:00 every day; it still runs if the
+    # scheduler was held up for up to a minute
+    scheduler.add_job(reset_all_machine_counters, 'cron', hour=6, minute=0, misfire_grace_time=60)
+    print(f"Scheduler started at {datetime.now()}. Next reset scheduled for 06:00")
+    print("Active jobs:", scheduler.get_jobs())  # Server-side log
+
+    # Ensure scheduler shuts down properly
+    atexit.register(lambda: scheduler.shutdown())
+
+def get_scheduler_pid():
+    """Pid of the process running the reset scheduler, or None if unknown."""
+    try:
+        with open(SCHEDULER_LOCK_FILE) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
 
-# Ensure scheduler shuts down properly
-atexit.register(lambda: scheduler.shutdown())
+def start_scheduler():
+    """Take part in scheduler leader election without blocking the caller."""
+    global _scheduler_election_started
+    if _scheduler_election_started:
+        return
+    _scheduler_election_started = True
+    threading.Thread(target=_acquire_scheduler_lock, name='scheduler-leader', daemon=True).start()
+
+def create_app():
+    """Application factory used by the WSGI entry point and the dev server."""
+    print(f"Kanshi.py web interface started (pid {os.getpid()}, database {DATABASE_FILE})")
+    try:
+        # Opening the writer switches the database to WAL, so readers never
+        # block the collector's writes. Tables the web interface reads may
+        # not exist yet if the collector has not been restarted since an
+        # upgrade, so create them here too.
+        with db.write_connection() as conn:
+            timeline_pyramid.ensure_schema(conn.cursor())
+            raw_capture.ensure_schema(conn.cursor())
+    except sqlite3.Error as e:
+        app.logger.error(f"Could not prepare database {DATABASE_FILE}: {e}")
+    start_scheduler()
+    live_subscriber.start()
+    return app
 
 def is_working_hours():
     """Check if current time is within working hours (6 AM - 6 PM)"""
@@ -71,10 +158,6 @@ def is_working_hours():
     end_time = now.replace(hour=18, minute=0, second=0, microsecond=0)
     return start_time <= now <= end_time
 
-def get_db_connection():
-    """Get a new database connection."""
-    return sqlite3.connect(DATABASE_FILE)
-
 def get_machine_history(machine_id=None):
     """Get today's history for machine(s)."""
     now = datetime.now()
@@ -84,7 +167,7 @@ def get_machine_history(machine_id=None):
     history_data = {}
     
     try:
-        with closing(get_db_connection()) as conn:
+        with db.read_connection() as conn:
             for mid in machine_ids:
                 cursor = conn.execute(
                     "SELECT timestamp, status FROM machine_events "
@@ -100,96 +183,388 @@ def get_machine_history(machine_id=None):
         app.logger.error(f"Database error: {e}")
     return history_data if machine_id is None else history_data.get(machine_id, [])
 
-def generate_timeline_data(machine_ids=None):
-    """Generate timeline data for specified machines."""
+def get_current_slot(now=None):
+    """Index of the last timeline slot that has started, or -1 before 6 AM."""
+    now = now or datetime.now()
+    start_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
+    if now < start_time:
+        return -1
+    return min(int((now - start_time) / SLOT_INTERVAL), TIMELINE_SLOTS - 1)
+
+def _timeline_slots(cursor, machine_id, now, first_slot=0):
+    """Statuses of timeline slots first_slot..current slot for one machine."""
+    start_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
+    last_slot = get_current_slot(now)
+    if first_slot > last_slot:
+        return []
+    window_start = start_time + first_slot * SLOT_INTERVAL
+
+    # Get the last known state before the requested window
+    cursor.execute("""
+        SELECT timestamp, status 
+        FROM machine_events 
+        WHERE machine_id = ? 
+        AND timestamp < ?
+        ORDER BY timestamp DESC
+        LIMIT 1
+    """, (machine_id, window_start.isoformat()))
+    
+    last_state = cursor.fetchone()
+    current_status = last_state[1] if last_state else 'UNKNOWN'
+
+    # Get the window's events
+    cursor.execute("""
+        SELECT timestamp, status 
+        FROM machine_events 
+        WHERE machine_id = ? 
+        AND timestamp >= ?
+        AND timestamp <= ?
+        ORDER BY timestamp ASC
+    """, (machine_id, window_start.isoformat(), now.isoformat()))
+    
+    events = [(datetime.fromisoformat(ts), status) for ts, status in cursor.fetchall()]
+
+    # Get current state
+    cursor.execute(
+        "SELECT current_status, current_start_time FROM machine_runtime WHERE machine_id = ?",
+        (machine_id,)
+    )
+    current_result = cursor.fetchone()
+    if current_result:
+        current_start = datetime.fromisoformat(current_result[1])
+        # Add current state if it's the most recent
+        if current_start >= window_start and (not events or current_start > events[-1][0]):
+            events.append((current_start, current_result[0]))
+
+    # Fill slots; each takes the status of the last event inside it
+    timeline = []
+    event_index = 0
+    for slot in range(first_slot, last_slot + 1):
+        next_time = start_time + (slot + 1) * SLOT_INTERVAL
+        while event_index < len(events) and events[event_index][0] < next_time:
+            current_status = events[event_index][1]
+            event_index += 1
+        timeline.append(current_status)
+    return timeline
+
+def generate_timeline_data(machine_ids=None, first_slots=None):
+    """Generate timeline data for specified machines.
+
+    Without first_slots every machine gets the full day of TIMELINE_SLOTS
+    slots, with future slots set to None. With first_slots (machine_id ->
+    slot index) only the slots from that index up to the current one are
+    returned, for delta updates.
+    """
     machine_ids = machine_ids or ["GRS_14", "GRS_17", "GRS_19"]
+    live = get_live_state()
+    if live:
+        return live.timeline_data(machine_ids, first_slots)
+
     timeline_data = {}
 
     try:
-        with closing(get_db_connection()) as conn:
+        with db.read_connection() as conn:
             cursor = conn.cursor()
             now = datetime.now()
-            start_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
-            end_time = now.replace(hour=18, minute=0, second=0, microsecond=0)
             
             for machine_id in machine_ids:
-                # Initialize timeline with 144 slots (12 hours * 12 intervals per hour)
-                timeline = []
-                current_time = start_time
-                interval = timedelta(minutes=5)
-
-                # Get the last known state from previous day
-                yesterday = now - timedelta(days=1)
-                cursor.execute("""
-                    SELECT timestamp, status 
-                    FROM machine_events 
-                    WHERE machine_id = ? 
-                    AND timestamp < ?
-                    ORDER BY timestamp DESC
-                    LIMIT 1
-                """, (machine_id, start_time.isoformat()))
-                
-                last_state = cursor.fetchone()
-                last_state_before_start = last_state[1] if last_state else 'UNKNOWN'
-
-                # Get today's events
-                cursor.execute("""
-                    SELECT timestamp, status 
-                    FROM machine_events 
-                    WHERE machine_id = ? 
-                    AND timestamp >= ?
-                    AND timestamp <= ?
-                    ORDER BY timestamp ASC
-                """, (machine_id, start_time.isoformat(), now.isoformat()))
-                
-                events = [(datetime.fromisoformat(ts), status) for ts, status in cursor.fetchall()]
-
-                # Get current state
-                cursor.execute(
-                    "SELECT current_status, current_start_time FROM machine_runtime WHERE machine_id = ?",
-                    (machine_id,)
-                )
-                current_result = cursor.fetchone()
-                if current_result:
-                    current_status = current_result[0]
-                    current_start = datetime.fromisoformat(current_result[1])
-                    # Add current state if it's the most recent
-                    if not events or current_start > events[-1][0]:
-                        events.append((current_start, current_status))
-
-                # Fill timeline slots
-                current_status = last_state_before_start
-                while current_time <= now and current_time < end_time:
-                    next_time = current_time + interval
-                    
-                    # Update status if there are any events in this interval
-                    for event_time, event_status in events:
-                        if current_time <= event_time < next_time:
-                            current_status = event_status
-                    
-                    timeline.append(current_status)
-                    current_time = next_time
+                if first_slots is not None:
+                    timeline_data[machine_id] = _timeline_slots(cursor, machine_id, now, first_slots[machine_id])
+                    continue
 
+                timeline = _timeline_slots(cursor, machine_id, now)
                 # Fill remaining slots with None
-                while len(timeline) < 144:  # 12 hours * 12 intervals
-                    timeline.append(None)
-
+                timeline.extend([None] * (TIMELINE_SLOTS - len(timeline)))
                 timeline_data[machine_id] = timeline
 
     except sqlite3.Error as e:
         app.logger.error(f"Error generating timeline data: {e}")
-        return {machine_id: [None] * 144 for machine_id in machine_ids}
+        if first_slots is not None:
+            raise
+        return {machine_id: [None] * TIMELINE_SLOTS for machine_id in machine_ids}
 
     return timeline_data
 
+def get_timeline_changes(since, client_slot):
+    """Find where each machine's timeline may differ from a client's copy.
+
+    The client's copy is described by the event sequence number (largest
+    machine_events id) and the slot index it was built at. Returns
+    (first_slots, changed_machines): the first slot to resend per machine and
+    the machines that logged events after ``since``.
+    """
+    live = get_live_state()
+    if live and since >= live.base_seq:
+        return live.timeline_changes(since, client_slot)
+
+    now = datetime.now()
+    start_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
+    first_slots = {machine_id: max(client_slot, 0) for machine_id in ["GRS_14", "GRS_17", "GRS_19"]}
+    changed_machines = set()
+
+    with db.read_connection() as conn:
+        cursor = conn.execute("""
+            SELECT machine_id, MIN(timestamp)
+            FROM machine_events
+            WHERE id > ?
+            GROUP BY machine_id
+        """, (since,))
+        for machine_id, earliest in cursor.fetchall():
+            if machine_id not in first_slots:
+                continue
+            changed_machines.add(machine_id)
+            event_slot = int((datetime.fromisoformat(earliest) - start_time) / SLOT_INTERVAL)
+            first_slots[machine_id] = max(0, min(first_slots[machine_id], event_slot))
+
+    return first_slots, changed_machines
+
+def get_sync_epoch(now=None):
+    """Epoch for delta updates: changes at midnight and at the 06:00 reset.
+
+    It only depends on the clock, so every worker agrees on it.
+    """
+    now = now or datetime.now()
+    shift = 'shift' if now.hour >= 6 else 'night'
+    return f"{now.date().isoformat()}/{shift}"
+
+def get_sync_state():
+    """Current event sequence number and epoch for delta updates.
+
+    A client holding a different epoch must do a full resync.
+    """
+    live = get_live_state()
+    if live:
+        return live.seq, get_sync_epoch()
+
+    with db.read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM machine_events")
+        seq = cursor.fetchone()[0] or 0
+    return seq, get_sync_epoch()
+
+def get_last_reset_time():
+    """Time of the last counter reset, or None."""
+    live = get_live_state()
+    if live:
+        return live.last_reset_time
+
+    with db.read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_reset_time FROM machine_runtime LIMIT 1")
+        last_reset = cursor.fetchone()
+    return datetime.fromisoformat(last_reset[0]) if last_reset and last_reset[0] else None
+
+class LiveState:
+    """In-memory dashboard state kept current by the collector's live channel.
+
+    Loaded from SQLite whenever the channel (re)connects, then updated from
+    each status message, so serving the dashboard never touches the
+    database. Mirrors what the SQLite path computes: per-machine runtime
+    rows, today's 5-minute timeline slots and the event sequence number.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = False
+        self.day = None
+        # Sync epoch at the last load; the state is stale once it changes
+        self.epoch = None
+        self.seq = 0
+        # Sequence number at the last load; older cursors need SQLite
+        self.base_seq = 0
+        self.last_reset_time = None
+        self.runtime = {}
+        # Per machine: filled slots, the status carried into later slots,
+        # and (event ids, slots) of today's events for delta lookups
+        self.timelines = {}
+        self.carry = {}
+        self.event_ids = {}
+        self.event_slots = {}
+
+    def load(self):
+        """Replace the state with a fresh snapshot from SQLite."""
+        now = datetime.now()
+        machine_ids = ["GRS_14", "GRS_17", "GRS_19"]
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(id) FROM machine_events")
+            seq = cursor.fetchone()[0] or 0
+            timelines = {machine_id: _timeline_slots(cursor, machine_id, now) for machine_id in machine_ids}
+            cursor.execute("""
+                SELECT machine_id, off_duration, prep_duration, on_duration, unknown_duration,
+                       current_status, current_start_time, last_reset_time
+                FROM machine_runtime
+            """)
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        with self.lock:
+            self.day = now.date()
+            self.epoch = get_sync_epoch(now)
+            self.seq = seq
+            self.base_seq = seq
+            self.runtime = {
+                machine_id: list(rows[machine_id][:6]) if machine_id in rows else [0, 0, 0, 0, None, None]
+                for machine_id in machine_ids
+            }
+            reset_times = [row[6] for row in rows.values() if row[6]]
+            self.last_reset_time = datetime.fromisoformat(max(reset_times)) if reset_times else None
+            for machine_id in machine_ids:
+                timeline = timelines[machine_id]
+                self.timelines[machine_id] = timeline
+                self.carry[machine_id] = timeline[-1] if timeline else (self.runtime[machine_id][4] or 'UNKNOWN')
+                self.event_ids[machine_id] = []
+                self.event_slots[machine_id] = []
+            self.ready = True
+
+    def apply(self, message):
+        """Apply one live channel message."""
+        kind = message.get("type")
+        if kind == "reset" or (kind == "heartbeat" and get_sync_epoch() != self.epoch):
+            self.load()
+            return
+        if kind != "status":
+            return
+
+        machine_id = message["machine_id"]
+        status = message["status"]
+        timestamp = datetime.fromisoformat(message["start_time"])
+        durations = message["durations"]
+        with self.lock:
+            if machine_id not in self.runtime:
+                return
+            if timestamp.date() != self.day:
+                # First reading of a new day; reload outside the lock
+                self.ready = False
+            else:
+                self.runtime[machine_id] = [
+                    durations["Off"], durations["Prep"], durations["On"], durations["Unknown"],
+                    status, message["start_time"]
+                ]
+                self.seq = max(self.seq, message["event_id"])
+
+                start_time = timestamp.replace(hour=6, minute=0, second=0, microsecond=0)
+                slot = int((timestamp - start_time) / SLOT_INTERVAL) if timestamp >= start_time else -1
+                if slot < TIMELINE_SLOTS:
+                    timeline = self.timelines[machine_id]
+                    if slot >= 0:
+                        # Slots without events keep the previous status
+                        while len(timeline) < slot:
+                            timeline.append(self.carry[machine_id])
+                        if len(timeline) == slot:
+                            timeline.append(status)
+                        else:
+                            timeline[slot] = status
+                    if slot >= len(timeline) - 1:
+                        self.carry[machine_id] = status
+                    self.event_ids[machine_id].append(message["event_id"])
+                    self.event_slots[machine_id].append(max(slot, 0))
+        if not self.ready:
+            self.load()
+
+    def runtime_data(self, machine_id):
+        with self.lock:
+            row = self.runtime.get(machine_id)
+        if not row:
+            return {"condition": "Unknown", "durations": {"Off": 0, "Prep": 0, "On": 0, "Unknown": 0}}
+        return _runtime_data(*row)
+
+    def _slots(self, machine_id, first_slot, last_slot):
+        timeline = self.timelines[machine_id]
+        slots = timeline[first_slot:last_slot + 1]
+        slots.extend([self.carry[machine_id]] * (last_slot + 1 - max(len(timeline), first_slot)))
+        return slots
+
+    def timeline_data(self, machine_ids, first_slots=None):
+        """Same result as generate_timeline_data, from memory."""
+        last_slot = get_current_slot()
+        timeline_data = {}
+        with self.lock:
+            for machine_id in machine_ids:
+                if first_slots is not None:
+                    timeline_data[machine_id] = self._slots(machine_id, first_slots[machine_id], last_slot)
+                    continue
+                timeline = self._slots(machine_id, 0, last_slot)
+                timeline.extend([None] * (TIMELINE_SLOTS - len(timeline)))
+                timeline_data[machine_id] = timeline
+        return timeline_data
+
+    def timeline_changes(self, since, client_slot):
+        """Same result as get_timeline_changes, from memory."""
+        first_slots = {}
+        changed_machines = set()
+        with self.lock:
+            for machine_id, event_ids in self.event_ids.items():
+                first_slots[machine_id] = max(client_slot, 0)
+                index = bisect_right(event_ids, since)
+                if index < len(event_ids):
+                    changed_machines.add(machine_id)
+                    first_slots[machine_id] = min(first_slots[machine_id], self.event_slots[machine_id][index])
+        return first_slots, changed_machines
+
+live_state = LiveState()
+
+def _live_disconnected():
+    live_state.ready = False
+
+live_subscriber = live_channel.LiveSubscriber(live_state.load, live_state.apply, _live_disconnected)
+
+def get_live_state():
+    """The in-memory state if the live channel is up, else None (use SQLite)."""
+    if live_state.ready and live_subscriber.healthy and live_state.epoch == get_sync_epoch():
+        return live_state
+    return None
+
+def _runtime_data(off_duration, prep_duration, on_duration, unknown_duration, current_status, current_start_time):
+    """Totals for a machine_runtime row, including the state still in progress."""
+    # Calculate current state duration only if within working hours
+    now = datetime.now()
+    if current_status and current_start_time and is_working_hours():
+        current_start = datetime.fromisoformat(current_start_time)
+        
+        # Ensure we don't count time before today's 6 AM
+        today_6am = now.replace(hour=6, minute=0, second=0, microsecond=0)
+        if current_start < today_6am:
+            current_start = today_6am
+        
+        # Ensure we don't count time after 6 PM
+        today_6pm = now.replace(hour=18, minute=0, second=0, microsecond=0)
+        end_time = min(now, today_6pm)
+        
+        current_duration = (end_time - current_start).total_seconds()
+        
+        # Only add current duration if it's positive
+        if current_duration > 0:
+            if current_status == "Off":
+                off_duration += current_duration
+            elif current_status == "Prep":
+                prep_duration += current_duration
+            elif current_status == "On":
+                on_duration += current_duration
+            elif current_status == "Unknown":
+                unknown_duration += current_duration
+    
+    return {
+        "condition": current_status or "Unknown",
+        "durations": {
+            "Off": round(off_duration),
+            "Prep": round(prep_duration),
+            "On": round(on_duration),
+            "Unknown": round(unknown_duration)
+        }
+    }
+
 def get_machine_runtime_data(machine_id):
     """Get runtime data for a specific machine."""
+    live = get_live_state()
+    if live:
+        return live.runtime_data(machine_id)
+
     try:
-        with closing(get_db_connection()) as conn:
+        with db.read_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT off_duration, prep_duration, on_duration, unknown_duration,
-                       current_status, current_start_time, last_reset_time
+                       current_status, current_start_time
                 FROM machine_runtime
                 WHERE machine_id = ?""", 
                 (machine_id,)
@@ -197,85 +572,63 @@ def get_machine_runtime_data(machine_id):
             result = cursor.fetchone()
             
             if result:
-                off_duration, prep_duration, on_duration, unknown_duration, current_status, current_start_time, last_reset_time = result
-                
-                # Calculate current state duration only if within working hours
-                now = datetime.now()
-                if current_status and current_start_time and is_working_hours():
-                    current_start = datetime.fromisoformat(current_start_time)
-                    
-                    # Ensure we don't count time before today's 6 AM
-                    today_6am = now.replace(hour=6, minute=0, second=0, microsecond=0)
-                    if current_start < today_6am:
-                        current_start = today_6am
-                    
-                    # Ensure we don't count time after 6 PM
-                    today_6pm = now.replace(hour=18, minute=0, second=0, microsecond=0)
-                    end_time = min(now, today_6pm)
-                    
-                    current_duration = (end_time - current_start).total_seconds()
-                    
-                    # Only add current duration if it's positive
-                    if current_duration > 0:
-                        if current_status == "Off":
-                            off_duration += current_duration
-                        elif current_status == "Prep":
-                            prep_duration += current_duration
-                        elif current_status == "On":
-                            on_duration += current_duration
-                        elif current_status == "Unknown":
-                            unknown_duration += current_duration
-                
-                return {
-                    "durations": {
-                        "Off": round(off_duration),
-                        "Prep": round(prep_duration),
-                        "On": round(on_duration),
-                        "Unknown": round(unknown_duration)
-                    }
-                }
-            return {"durations": {"Off": 0, "Prep": 0, "On": 0, "Unknown": 0}}
+                return _runtime_data(*result)
+            return {"condition": "Unknown", "durations": {"Off": 0, "Prep": 0, "On": 0, "Unknown": 0}}
     except Exception as e:
         print(f"Error getting runtime data: {e}")
-        return {"durations": {"Off": 0, "Prep": 0, "On": 0, "Unknown": 0}}
+        return {"condition": "Unknown", "durations": {"Off": 0, "Prep": 0, "On": 0, "Unknown": 0}}
+
+def get_current_conditions():
+    """Current status of every machine."""
+    live = get_live_state()
+    if live:
+        return {
+            machine_id: live.runtime_data(machine_id)["condition"]
+            for machine_id in ["GRS_14", "GRS_17", "GRS_19"]
+        }
+
+    conditions = {}
+    with db.read_connection() as conn:
+        cursor = conn.cursor()
+        for machine_id in ["GRS_14", "GRS_17", "GRS_19"]:
+            cursor.execute("""
+                SELECT current_status
+                FROM machine_runtime
+                WHERE machine_id = ?
+            """, (machine_id,))
+            result = cursor.fetchone()
+            conditions[machine_id] = result[0] if result else "Unknown"
+    return conditions
 
 def fetch_current_data():
-    """Fetch current state of all machines."""
-    machine_data = {}
+    """Fetch current state of all machines as a list of per-machine dicts."""
+    machine_data = []
     now = datetime.now()
 
     try:
-        with closing(get_db_connection()) as conn:
-            cursor = conn.cursor()
-            for machine_id in ["GRS_14", "GRS_17", "GRS_19"]:
-                cursor.execute("""
-                    SELECT current_status
-                    FROM machine_runtime
-                    WHERE machine_id = ?
-                """, (machine_id,))
-                result = cursor.fetchone()
-                condition = result[0] if result else "Unknown"
-                
-                runtime_data = get_machine_runtime_data(machine_id)
-                machine_data[machine_id] = {
-                    "condition": condition,
-                    "timestamp": now,
-                    "total_durations": runtime_data["durations"]
-                }
+        conditions = get_current_conditions()
+        for machine_id, condition in conditions.items():
+            runtime_data = get_machine_runtime_data(machine_id)
+            machine_data.append({
+                "machine_id": machine_id,
+                "condition": condition,
+                "timestamp": now,
+                "total_durations": runtime_data["durations"]
+            })
     except sqlite3.Error as e:
         app.logger.error(f"Database error in fetch_current_data: {e}")
         
-    return pd.DataFrame.from_dict(machine_data, orient='index').reset_index().rename(columns={'index': 'machine_id'})
+    return machine_data
 
 @app.route("/")
 def dashboard():
     """Main dashboard route."""
-    df = fetch_current_data()
+    machine_data = fetch_current_data()
     return render_template(
         "dashboard.html",
-        latest_data=df.to_dict('records'),
-        latest_timestamp=df['timestamp'].iloc[0] if not df.empty else None,
-        machine_conditions=df.set_index('machine_id')['condition'].to_dict(),
+        latest_data=machine_data,
+        latest_timestamp=machine_data[0]['timestamp'] if machine_data else None,
+        machine_conditions={row['machine_id']: row['condition'] for row in machine_data},
         timeline_data=generate_timeline_data()
     )
 
@@ -285,70 +638,76 @@ def update_conditions():
     try:
         now = datetime.now()
         
-        # Check if we need to trigger a reset
+        # The reset itself is only done by the scheduler leader's 06:00 job;
+        # just_reset only tells the client to expect zeroed counters
         reset_time = now.replace(hour=6, minute=0, second=0, microsecond=0)
         time_diff = (now - reset_time).total_seconds()
-        
-        # Consider reset time if we're within 5 seconds after the target time
-        # or if we're up to 1 minute past and no reset has occurred
         just_reset = (0 <= time_diff <= 5)
-        
-        # Get last reset time from database
-        with closing(get_db_connection()) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT last_reset_time FROM machine_runtime LIMIT 1")
-            last_reset = cursor.fetchone()
-            last_reset_time = datetime.fromisoformat(last_reset[0]) if last_reset and last_reset[0] else None
-            
-            # Force reset if we're past reset time and haven't reset yet
-            if last_reset_time and last_reset_time.date() < now.date():
-                if 0 <= time_diff <= 60:  # Within 1 minute after reset time
-                    print("Forcing reset - past reset time and no reset today")
-                    just_reset = True
-        
-        # If it's reset time or we need to force a reset, perform the reset
-        if just_reset:
-            print(f"Reset triggered at {now} (time_diff: {time_diff}s)")
-            reset_all_machine_counters()
-            
-            # Double-check the reset was applied
-            with closing(get_db_connection()) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT SUM(off_duration + prep_duration + on_duration + unknown_duration) FROM machine_runtime")
-                total = cursor.fetchone()[0]
-                if total > 0:
-                    print("Reset verification failed - retrying reset")
-                    reset_all_machine_counters()
-        
-        # Fetch latest data after potential reset
-        df = fetch_current_data()
-        conditions = df.set_index('machine_id')['condition'].to_dict()
-        total_durations = {
-            machine: get_machine_runtime_data(machine)["durations"]
-            for machine in ["GRS_14", "GRS_17", "GRS_19"]
-        }
-        
-        # Add debug information to the response
-        debug_info = {
-            "current_time": now.isoformat(),
-            "reset_check_time": reset_time.isoformat(),
-            "time_diff_seconds": time_diff,
+
+        # Delta request: the client sends back the sync state of its last response
+        since = request.args.get('since', type=int)
+        client_slot = request.args.get('slot', type=int)
+        client_epoch = request.args.get('epoch')
+
+        seq, epoch = get_sync_state()
+        current_slot = get_current_slot(now)
+        full = (
+            just_reset
+            or since is None or client_slot is None
+            or client_epoch != epoch
+            or since > seq
+            or client_slot > current_slot
+        )
+
+        response = {
+            "latest_timestamp": now.strftime("%Y-%m-%d %H:%M:%S (JST)"),
+            "server_time": now.isoformat(),
             "just_reset": just_reset,
-            "last_reset_time": last_reset_time.isoformat() if last_reset_time else None,
-            "scheduler_jobs": str(scheduler.get_jobs()),
-            "next_run_time": str(scheduler.get_jobs()[0].next_run_time) if scheduler.get_jobs() else "No jobs scheduled"
+            "sync": {"seq": seq, "slot": current_slot, "epoch": epoch, "full": full}
         }
-        
-        print(f"Debug info: {debug_info}")
-        
-        return jsonify({
-            "machine_conditions": conditions,
-            "latest_timestamp": now.strftime("%Y-%m-%d %H:%M:%S (JST)"),
-            "timeline_data": generate_timeline_data(),
-            "total_durations": total_durations,
-            "debug_info": debug_info,
-            "just_reset": just_reset
-        })
+
+        if full:
+            # Fetch latest data after potential reset
+            machine_data = fetch_current_data()
+            response["machine_conditions"] = {row["machine_id"]: row["condition"] for row in machine_data}
+            response["total_durations"] = {row["machine_id"]: row["total_durations"] for row in machine_data}
+            response["timeline_data"] = generate_timeline_data()
+
+            # Add debug information to the response
+            last_reset_time = get_last_reset_time()
+            debug_info = {
+                "current_time": now.isoformat(),
+                "reset_check_time": reset_time.isoformat(),
+                "time_diff_seconds": time_diff,
+                "just_reset": just_reset,
+                "last_reset_time": last_reset_time.isoformat() if last_reset_time else None,
+                "scheduler_leader": scheduler_leader,
+                "scheduler_pid": get_scheduler_pid(),
+                "worker_pid": os.getpid(),
+                "live_channel": live_subscriber.healthy,
+                "scheduler_jobs": str(scheduler.get_jobs()) if scheduler else "[]",
+                "next_run_time": str(scheduler.get_jobs()[0].next_run_time) if scheduler and scheduler.get_jobs() else "No jobs scheduled"
+            }
+            print(f"Debug info: {debug_info}")
+            response["debug_info"] = debug_info
+        else:
+            # Only machines that logged events since `since` can have new
+            # statuses or durations; only slots from the earliest such event
+            # (or the client's last, possibly partial, slot) can have changed.
+            first_slots, changed_machines = get_timeline_changes(since, client_slot)
+            response["machine_conditions"] = {}
+            response["total_durations"] = {}
+            for machine_id in changed_machines:
+                runtime_data = get_machine_runtime_data(machine_id)
+                response["machine_conditions"][machine_id] = runtime_data["condition"]
+                response["total_durations"][machine_id] = runtime_data["durations"]
+            updates = generate_timeline_data(first_slots=first_slots)
+            response["timeline_updates"] = {
+                machine_id: {"from": first_slots[machine_id], "slots": slots}
+                for machine_id, slots in updates.items() if slots
+            }
+
+        return jsonify(response)
     except Exception as e:
         app.logger.error(f"Error in update_conditions: {e}")
         return jsonify({"error": str(e), "debug_info": {"error_time": datetime.now().isoformat()}}), 500
@@ -371,7 +730,7 @@ def history():
 def get_available_dates():
     """Get list of dates that have machine data."""
     try:
-        with closing(get_db_connection()) as conn:
+        with db.read_connection() as conn:
             cursor = conn.cursor()
             # Only get dates before today that have data
             cursor.execute("""
@@ -398,7 +757,7 @@ def get_history_data(date):
                 machine_id: [] for machine_id in ["GRS_14", "GRS_17", "GRS_19"]
             })
 
-        with closing(get_db_connection()) as conn:
+        with db.read_connection() as conn:
             cursor = conn.cursor()
             
             # Get the start and end of the working day (6 AM to 6 PM)
@@ -481,8 +840,123 @@ def get_history_data(date):
         app.logger.error(f"Error getting history data: {e}")
         return jsonify({"error": str(e)}), 500
         
+def _request_datetime(name, default):
+    """Datetime query parameter as naive local time, like the stored timestamps."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+@app.route("/api/timeline")
+def get_timeline():
+    """Zoomable timeline for one machine from the precomputed slot levels.
+
+    Query parameters: machine (required), from and to (ISO datetimes, with
+    an offset they are converted to local time; default today's working
+    hours) and resolution (minutes, or "day").
+    The coarsest stored level at least as fine as the requested resolution
+    is used; without a resolution the level is chosen by
+    timeline_pyramid.auto_resolution (about TIMELINE_TARGET_SLOTS slots).
+    """
+    machine_id = request.args.get('machine')
+    if machine_id not in ["GRS_14", "GRS_17", "GRS_19"]:
+        return jsonify({"error": f"Unknown machine: {machine_id}"}), 400
+
+    try:
+        now = datetime.now()
+        start = _request_datetime('from', now.replace(hour=6, minute=0, second=0, microsecond=0))
+        end = _request_datetime('to', now.replace(hour=18, minute=0, second=0, microsecond=0))
+        if end <= start:
+            raise ValueError("'to' must be after 'from'")
+
+        requested = request.args.get('resolution')
+        if requested == 'day':
+            requested = timeline_pyramid.DAILY
+        elif requested:
+            requested = float(requested)
+            if not math.isfinite(requested) or requested <= 0:
+                raise ValueError("'resolution' must be a positive number of minutes or 'day'")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if requested:
+        resolution = timeline_pyramid.pick_resolution(requested)
+    else:
+        resolution = timeline_pyramid.auto_resolution(start, end, now, TIMELINE_TARGET_SLOTS, TIMELINE_MAX_SLOTS)
+    if timeline_pyramid.slot_count(start, end, resolution) > TIMELINE_MAX_SLOTS:
+        return jsonify({"error": f"Range too large for resolution {resolution} minutes"}), 400
+
+    try:
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
+            # The state in progress is not in timeline_slots until it ends
+            cursor.execute(
+                "SELECT current_status, current_start_time FROM machine_runtime WHERE machine_id = ?",
+                (machine_id,)
+            )
+            current = cursor.fetchone()
+            open_interval = None
+            if current and current[1]:
+                open_interval = (current[0], datetime.fromisoformat(current[1]))
+            slot_starts, durations = timeline_pyramid.fetch_slots(
+                cursor, machine_id, start, min(end, now), resolution, open_interval
+            )
+    except sqlite3.Error as e:
+        app.logger.error(f"Error getting timeline: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "machine": machine_id,
+        "resolution": resolution,
+        "from": timeline_pyramid.slot_floor(start, resolution).isoformat(),
+        "to": end.isoformat(),
+        "slot_starts": [slot.isoformat() for slot in slot_starts],
+        "slots": [timeline_pyramid.dominant_status(d) for d in durations],
+        "durations": [{status: round(seconds) for status, seconds in d.items()} for d in durations]
+    })
+
+@app.route("/api/raw_signal")
+def get_raw_signal():
+    """Raw lamp/switch samples for one machine, for diagnosing sensor issues.
+
+    Query parameters: machine (required), from and to (ISO datetimes,
+    default the last 10 minutes). Captures are only recorded when the data
+    collector runs with raw capture enabled (KANSHI_RAW_CAPTURE=1);
+    otherwise the list is empty.
+    """
+    machine_id = request.args.get('machine')
+    if machine_id not in ["GRS_14", "GRS_17", "GRS_19"]:
+        return jsonify({"error": f"Unknown machine: {machine_id}"}), 400
+
+    try:
+        end = _request_datetime('to', datetime.now())
+        start = _request_datetime('from', end - timedelta(minutes=10))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with db.read_connection() as conn:
+            cursor = conn.cursor()
+            # Missing if neither the collector nor create_app() could create it
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'raw_signal_captures'")
+            captures = raw_capture.fetch_window(cursor, machine_id, start, end) if cursor.fetchone() else []
+    except sqlite3.Error as e:
+        app.logger.error(f"Error getting raw signal: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "machine": machine_id,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "captures": captures
+    })
+
 if __name__ == "__main__":
+    # Development only; production runs through gunicorn (see gunicorn.conf.py)
     try:
-        app.run(host='0.0.0.0', port=5000)
+        create_app().run(host='0.0.0.0', port=5000, threaded=True)
     except Exception as e:
         app.logger.error(f"Error starting web server: {e}")
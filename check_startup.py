@@ -0,0 +1,80 @@
+"""Check the web interface's cold-start time and memory against a budget.
+
+Imports Kanshi and calls create_app() in a fresh interpreter, against a
+throwaway database, and fails if it takes longer or uses more memory than
+allowed, or if it pulls in pandas. The child is always the scheduler
+leader (the dev server always is), so the measurement waits for the
+scheduler to start. test_startup.py runs the same check under pytest.
+
+Usage:
+    python check_startup.py [--max-seconds 1.0] [--max-rss-mb 48]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Run in the child interpreter; prints one JSON line
+CHILD = """
+import json, resource, sys, threading, time
+started = time.perf_counter()
+import Kanshi
+Kanshi.create_app()
+# Leader election and the scheduler start run on a background thread
+for thread in threading.enumerate():
+    if thread.name == "scheduler-leader":
+        thread.join(%(election_timeout)s)
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": (rss_kb / 1024) if sys.platform != "darwin" else rss_kb / 1024 / 1024,
+    "pandas": "pandas" in sys.modules,
+    "scheduler": Kanshi.scheduler is not None and Kanshi.scheduler.running,
+}))
+"""
+
+MAX_SECONDS = 1.0
+MAX_RSS_MB = 48
+ELECTION_TIMEOUT = 10
+
+def measure():
+    """Start the app once in a child process and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   KANSHI_DATABASE=os.path.join(tmp, "machine_monitoring.db"),
+                   KANSHI_LIVE_SOCKET=os.path.join(tmp, "kanshi_live.sock"))
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD % {"election_timeout": ELECTION_TIMEOUT}],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env, capture_output=True, text=True, check=True
+        )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check Kanshi startup time and memory.")
+    parser.add_argument("--max-seconds", type=float, default=MAX_SECONDS)
+    parser.add_argument("--max-rss-mb", type=float, default=MAX_RSS_MB)
+    args = parser.parse_args(argv)
+
+    result = measure()
+    print(f"Startup: {result['seconds']:.3f}s (budget {args.max_seconds}s), "
+          f"peak RSS: {result['rss_mb']:.1f}MB (budget {args.max_rss_mb}MB)")
+
+    failures = []
+    if result["seconds"] > args.max_seconds:
+        failures.append("startup time over budget")
+    if result["rss_mb"] > args.max_rss_mb:
+        failures.append("memory over budget")
+    if result["pandas"]:
+        failures.append("pandas imported on startup")
+    if not result["scheduler"]:
+        failures.append("scheduler did not start")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
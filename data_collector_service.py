@@ -6,7 +6,11 @@ import logging
 from logging.handlers import RotatingFileHandler
 import sys
 import os
+import signal
 from contextlib import closing
+import timeline_pyramid
+import raw_capture
+import live_channel
 
 # Configure logging
 log_file = '/home/reigicad/KoukiKanshi/data_collector.log'
@@ -32,11 +36,13 @@ PULLDOWN_PINS = [GRS_17Lamp, GRS_17Switch, GRS_19Lamp, GRS_19Switch]
 PULLUP_PINS = [GRS_14Lamp, GRS_14Switch]
 
 # Configuration
-DATABASE_FILE = '/home/reigicad/KoukiKanshi/machine_monitoring.db'
+DATABASE_FILE = os.environ.get('KANSHI_DATABASE', '/home/reigicad/KoukiKanshi/machine_monitoring.db')
 SAMPLE_DURATION = 8
 SAMPLE_RATE = 0.08
 MAJORITY_THRESHOLD = 0.7
 COLLECTION_INTERVAL = 10  # Collect data every 10 seconds
+# Store the raw lamp/switch samples (run-length encoded) for diagnostics
+RAW_CAPTURE = os.environ.get('KANSHI_RAW_CAPTURE', '0') == '1'
 
 def setup_gpio():
     """Initialize GPIO settings"""
@@ -57,6 +63,20 @@ def get_db_connection():
     """Get a new database connection"""
     return sqlite3.connect(DATABASE_FILE)
 
+raw_buffer = raw_capture.RawCaptureBuffer(get_db_connection) if RAW_CAPTURE else None
+
+# Live status channel to the web interface, started in main()
+publisher = None
+
+def publish(message):
+    """Send a message on the live channel; never fails the caller"""
+    if publisher is None:
+        return
+    try:
+        publisher.publish(message)
+    except Exception as e:
+        logger.error(f"Error publishing live message: {e}")
+
 def is_working_hours():
     """Check if current time is within working hours (6 AM - 6 PM)"""
     now = datetime.now()
@@ -64,12 +84,13 @@ def is_working_hours():
     end_time = now.replace(hour=18, minute=0, second=0, microsecond=0)
     return start_time <= now <= end_time
 
-def get_machine_condition(lamp_pin, switch_pin, invert=False):
+def get_machine_condition(lamp_pin, switch_pin, invert=False, machine_id=None):
     """Read machine condition using majority voting"""
     try:
         lamp_readings = []
         switch_readings = []
         num_samples = int(SAMPLE_DURATION / SAMPLE_RATE)
+        capture_start = datetime.now()
 
         for _ in range(num_samples):
             lamp_value = GPIO.input(lamp_pin)
@@ -82,6 +103,9 @@ def get_machine_condition(lamp_pin, switch_pin, invert=False):
             switch_readings.append(switch_value)
             time.sleep(SAMPLE_RATE)
 
+        if raw_buffer is not None and machine_id:
+            raw_buffer.add(machine_id, capture_start, datetime.now(), lamp_readings, switch_readings)
+
         lamp_on_count = sum(lamp_readings)
         switch_on_count = sum(switch_readings)
         lamp_is_on = lamp_on_count >= (num_samples * MAJORITY_THRESHOLD)
@@ -145,6 +169,12 @@ def log_status_change(machine_id, status, max_retries=3, retry_delay=0.01):
                     duration_column = previous_status.lower()
                     current_durations[duration_column] += duration
 
+                # Roll the finished interval into the zoomable timeline levels
+                if previous_status and previous_start_time:
+                    timeline_pyramid.add_interval(
+                        cursor, machine_id, previous_status, previous_start_time, current_time
+                    )
+
                 # Insert event into machine_events table
                 cursor.execute(
                     """INSERT INTO machine_events 
@@ -152,6 +182,7 @@ def log_status_change(machine_id, status, max_retries=3, retry_delay=0.01):
                        VALUES (?, ?, ?)""",
                     (machine_id, current_time.isoformat(), status)
                 )
+                event_id = cursor.lastrowid
                 
                 # Update machine_runtime table
                 cursor.execute("""
@@ -172,6 +203,19 @@ def log_status_change(machine_id, status, max_retries=3, retry_delay=0.01):
                 cursor.execute("COMMIT")
                 conn.commit()
                 logger.info(f"Status change logged for {machine_id}: {status}")
+                publish({
+                    "type": "status",
+                    "machine_id": machine_id,
+                    "status": status,
+                    "start_time": current_time.isoformat(),
+                    "event_id": event_id,
+                    "durations": {
+                        "Off": current_durations['off'],
+                        "Prep": current_durations['prep'],
+                        "On": current_durations['on'],
+                        "Unknown": current_durations['unknown']
+                    }
+                })
                 return True
                 
         except sqlite3.Error as e:
@@ -197,6 +241,7 @@ def reset_daily_counters():
             """)
             conn.commit()
             logger.info("Daily counters reset successfully")
+            publish({"type": "reset"})
     except sqlite3.Error as e:
         logger.error(f"Error resetting daily counters: {e}")
 
@@ -209,17 +254,47 @@ def delete_old_data():
                 "DELETE FROM machine_events WHERE timestamp < ?",
                 (one_month_ago.isoformat(),)
             )
+            deleted_events = cursor.rowcount
+            # Finer timeline levels follow their own retention; daily slots are kept
+            slot_cutoff = datetime.now() - timeline_pyramid.FINE_RETENTION
+            deleted_slots = timeline_pyramid.delete_before(cursor, slot_cutoff)
             conn.commit()
-            logger.info(f"Deleted {cursor.rowcount} old records")
+            logger.info(f"Deleted {deleted_events} old records")
+            logger.info(f"Deleted {deleted_slots} old timeline slots")
     except sqlite3.Error as e:
         logger.error(f"Error deleting old data: {e}")
 
+def ensure_tables():
+    """Create tables the collector maintains besides the core schema"""
+    try:
+        with closing(get_db_connection()) as conn:
+            timeline_pyramid.ensure_schema(conn.cursor())
+            if RAW_CAPTURE:
+                raw_capture.ensure_schema(conn.cursor())
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Error creating tables: {e}")
+
+def handle_sigterm(signum, frame):
+    """Stop like Ctrl+C so the cleanup below runs when systemd stops the service"""
+    raise KeyboardInterrupt
+
 def main():
     """Main data collection loop"""
     logger.info("Starting data collector service")
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
     try:
         setup_gpio()
+        ensure_tables()
+
+        global publisher
+        try:
+            publisher = live_channel.LivePublisher()
+            publisher.start()
+        except OSError as e:
+            logger.error(f"Live channel unavailable, web interface will poll the database: {e}")
+            publisher = None
         
         # Initial reset of counters if starting near 6 AM
         now = datetime.now()
@@ -246,7 +321,7 @@ def main():
                 # Collect data during working hours
                 if is_working_hours():
                     # GRS_14 uses inverted logic
-                    condition = get_machine_condition(GRS_14Lamp, GRS_14Switch, invert=True)
+                    condition = get_machine_condition(GRS_14Lamp, GRS_14Switch, invert=True, machine_id="GRS_14")
                     log_status_change("GRS_14", condition)
                     
                     # Other machines use normal logic
@@ -254,9 +329,18 @@ def main():
                         ("GRS_17", GRS_17Lamp, GRS_17Switch),
                         ("GRS_19", GRS_19Lamp, GRS_19Switch)
                     ]:
-                        condition = get_machine_condition(lamp_pin, switch_pin)
+                        condition = get_machine_condition(lamp_pin, switch_pin, machine_id=machine_id)
                         log_status_change(machine_id, condition)
+
+                # Also outside working hours, so the shift's last batch is
+                # written within FLUSH_INTERVAL instead of the next morning
+                if raw_buffer is not None:
+                    try:
+                        raw_buffer.flush_if_due()
+                    except sqlite3.Error as e:
+                        logger.error(f"Error writing raw captures: {e}")
                 
+                publish({"type": "heartbeat", "timestamp": datetime.now().isoformat()})
                 time.sleep(COLLECTION_INTERVAL)
                 
             except Exception as e:
@@ -268,6 +352,13 @@ def main():
     except Exception as e:
         logger.error(f"Fatal error: {e}")
     finally:
+        if raw_buffer is not None:
+            try:
+                raw_buffer.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing raw captures: {e}")
+        if publisher is not None:
+            publisher.close()
         GPIO.cleanup()
         logger.info("Cleanup completed")
 
@@ -0,0 +1,151 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Read-side tuning. mmap lets readers share the OS page cache instead of
+# copying pages; cache_size is negative so it is expressed in KiB. The
+# statement cache is twice sqlite3's default of 128.
+MMAP_SIZE = 64 * 1024 * 1024
+CACHE_SIZE_KIB = 8 * 1024
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+class ConnectionPool:
+    """Thread-safe pool of read-only SQLite connections plus one writer.
+
+    Readers open the database with a ``mode=ro`` URI and ``query_only`` so they
+    can never take a write lock; with the database in WAL mode they also never
+    block (or get blocked by) the data collector's writes. All writes from the
+    web process go through the single writer connection, serialised by a lock.
+
+    Connections are created lazily and are discarded after a fork so that
+    gunicorn workers never share a SQLite handle.
+    """
+
+    def __init__(self, database_file, max_readers=8):
+        self.database_file = database_file
+        self.max_readers = max_readers
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._readers = queue.LifoQueue()
+        self._created = 0
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset_state()
+
+    def _open_reader(self):
+        conn = sqlite3.connect(
+            f"file:{self.database_file}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        return conn
+
+    def _open_writer(self):
+        conn = sqlite3.connect(
+            self.database_file,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+        )
+        # WAL is persistent in the database file, so setting it once here also
+        # applies to the read-only connections and the collector.
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _take_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_readers:
+                self._created += 1
+                try:
+                    return self._open_reader()
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+        # Pool exhausted: wait for another thread to hand a connection back
+        return self._readers.get(timeout=BUSY_TIMEOUT_MS / 1000)
+
+    def _discard_reader(self, conn):
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def read_connection(self):
+        """Borrow a read-only connection for the duration of the block."""
+        self._check_pid()
+        try:
+            conn = self._take_reader()
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+        pid = self._pid
+        healthy = True
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            # The connection may be in a bad state; don't hand it out again
+            healthy = False
+            raise
+        finally:
+            if healthy and pid == self._pid:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._readers.put(conn)
+            elif pid == self._pid:
+                self._discard_reader(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def write_connection(self):
+        """Hold the single writer connection for the duration of the block.
+
+        The block's work is committed on success and rolled back on error.
+        """
+        self._check_pid()
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = self._open_writer()
+            conn = self._writer
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    def close(self):
+        """Close every pooled connection."""
+        with self._lock:
+            while True:
+                try:
+                    self._readers.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
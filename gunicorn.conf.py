@@ -0,0 +1,25 @@
+"""Production server settings for the Kanshi web interface.
+
+Run with:  gunicorn -c gunicorn.conf.py
+"""
+import multiprocessing
+import os
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get("KANSHI_BIND", "0.0.0.0:5000")
+
+# Threaded workers: the dashboard is I/O bound (SQLite reads), so a few
+# processes with several threads each serve many dashboards on the Pi.
+worker_class = "gthread"
+workers = int(os.environ.get("KANSHI_WORKERS", min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get("KANSHI_THREADS", 4))
+timeout = 30
+graceful_timeout = 10
+
+# Each worker imports the app itself; the daily reset scheduler runs in
+# exactly one of them (file lock, see Kanshi.start_scheduler).
+preload_app = False
+
+accesslog = None
+errorlog = "-"
+loglevel = "info"
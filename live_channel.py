@@ -0,0 +1,204 @@
+"""Live status channel from the data collector to the web interface.
+
+The collector runs a LivePublisher on a Unix-domain stream socket and
+writes one JSON message per line to every connected reader: a "status"
+message for each logged reading (carrying the machine's full runtime
+state, so applying one twice is harmless), a "heartbeat" per collection
+cycle and a "reset" after the daily counter reset.
+
+Each web worker runs a LiveSubscriber. After every (re)connect it calls
+on_connect, which reloads its state from SQLite, and then applies the
+messages as they arrive. A worker that resets the counters itself sends a
+"reset" message back, which the publisher relays to every reader.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+
+SOCKET_PATH = os.environ.get('KANSHI_LIVE_SOCKET', '/home/reigicad/KoukiKanshi/kanshi_live.sock')
+SEND_TIMEOUT = 0.2
+RECONNECT_DELAY = 2
+# A reader that hears nothing (not even a heartbeat) for this long is stale
+HEARTBEAT_TIMEOUT = 60
+# Message types a reader may send for the publisher to relay
+RELAYED_TYPES = ("reset",)
+
+logger = logging.getLogger('LiveChannel')
+
+class LivePublisher:
+    """Accepts readers on a Unix socket and broadcasts messages to them."""
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self._clients = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Bind the socket and accept readers in a background thread."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.path)
+        os.chmod(self.path, 0o660)
+        self._server.listen(16)
+        threading.Thread(target=self._accept_loop, name='live-publisher', daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            client.settimeout(SEND_TIMEOUT)
+            with self._lock:
+                self._clients.append(client)
+            threading.Thread(target=self._read_loop, args=(client,), name='live-publisher-reader',
+                             daemon=True).start()
+
+    def _read_loop(self, client):
+        """Relay the messages a reader sends (see RELAYED_TYPES) to every reader."""
+        buffer = b""
+        while True:
+            try:
+                readable, _, _ = select.select([client], [], [], HEARTBEAT_TIMEOUT)
+            except (OSError, ValueError):
+                # Closed by publish() after a failed send
+                return
+            with self._lock:
+                if client not in self._clients:
+                    return
+            if not readable:
+                continue
+            try:
+                data = client.recv(4096)
+            except OSError:
+                data = b""
+            if not data:
+                self._drop(client)
+                return
+            *lines, buffer = (buffer + data).split(b"\n")
+            for line in lines:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(message, dict) and message.get("type") in RELAYED_TYPES:
+                    self.publish({"type": message["type"]})
+
+    def _drop(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+        client.close()
+
+    def publish(self, message):
+        """Send a message to every reader; readers that cannot keep up are dropped."""
+        data = (json.dumps(message) + "\n").encode()
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    self._clients.remove(client)
+                    client.close()
+
+    def close(self):
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+class LiveSubscriber:
+    """Keeps a connection to the publisher and feeds its messages to a callback."""
+
+    def __init__(self, on_connect, on_message, on_disconnect=None, path=SOCKET_PATH):
+        self.path = path
+        self.on_connect = on_connect
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.connected = False
+        self.last_message = 0.0
+        self._started = False
+        self._sock = None
+        self._send_lock = threading.Lock()
+        # Last failure logged while not connected, so retries don't repeat it
+        self._last_error = None
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._run, name='live-subscriber', daemon=True).start()
+
+    def send(self, message):
+        """Send a message to the publisher; False if the channel is down."""
+        sock = self._sock
+        if sock is None:
+            return False
+        try:
+            with self._send_lock:
+                sock.sendall((json.dumps(message) + "\n").encode())
+            return True
+        except OSError as e:
+            logger.error(f"Could not send live message: {e}")
+            return False
+
+    @property
+    def healthy(self):
+        """Connected and heard from the collector recently."""
+        return self.connected and time.monotonic() - self.last_message < HEARTBEAT_TIMEOUT
+
+    def _log_failure(self, error):
+        """Log a connection failure once, until it changes or a connect succeeds."""
+        if error != self._last_error:
+            logger.error(f"{error}; retrying every {RECONNECT_DELAY}s")
+            self._last_error = error
+
+    def _run(self):
+        while True:
+            stage = "connect to"
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    sock.settimeout(HEARTBEAT_TIMEOUT)
+                    # Load the snapshot after connecting so nothing sent in
+                    # between is missed; messages are idempotent
+                    stage = "load the snapshot for"
+                    self.on_connect()
+                    self.connected = True
+                    self.last_message = time.monotonic()
+                    self._sock = sock
+                    if self._last_error is not None:
+                        logger.info(f"Live channel {self.path} connected")
+                        self._last_error = None
+                    for line in sock.makefile('r', encoding='utf-8'):
+                        self.last_message = time.monotonic()
+                        try:
+                            self.on_message(json.loads(line))
+                        except (ValueError, KeyError, TypeError) as e:
+                            logger.error(f"Bad live message {line!r}: {e}")
+            except Exception as e:
+                if self.connected:
+                    logger.error(f"Live channel disconnected: {e}")
+                else:
+                    self._log_failure(f"Could not {stage} live channel {self.path}: {e}")
+            self._sock = None
+            if self.connected:
+                self.connected = False
+                if self.on_disconnect:
+                    self.on_disconnect()
+            time.sleep(RECONNECT_DELAY)
@@ -1,7 +1,10 @@
+import os
 import sqlite3
 from contextlib import closing
+import timeline_pyramid
+import raw_capture
 
-DATABASE_FILE = '/home/reigicad/KoukiKanshi/machine_monitoring.db'
+DATABASE_FILE = os.environ.get('KANSHI_DATABASE', '/home/reigicad/KoukiKanshi/machine_monitoring.db')
 
 def migrate_database():
     """Migrate the database schema to include duration columns."""
@@ -55,7 +58,15 @@ def migrate_database():
                 ON machine_events(timestamp)
             """)
             
+            # Zoomable timeline levels maintained by the data collector
+            timeline_pyramid.ensure_schema(cursor)
+            # Ring buffer for optional raw sample capture
+            raw_capture.ensure_schema(cursor)
+            
             conn.commit()
+
+            # Let the web interface read while the collector writes
+            cursor.execute("PRAGMA journal_mode = WAL")
             print("Database migration completed successfully.")
     except Exception as e:
         print(f"Error during migration: {e}")
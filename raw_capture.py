@@ -0,0 +1,175 @@
+"""Run-length-encoded capture of raw lamp/switch samples.
+
+Each call to get_machine_condition() takes ~100 samples per pin and keeps
+only the vote. With raw capture enabled the collector also stores the
+sample streams, so "Unknown" readings and flapping signals can be diagnosed
+later. A stream is stored as its first value plus the lengths of the runs
+of equal samples (two bytes per run), so a steady signal costs two bytes.
+
+Captures go into ``raw_signal_captures``, a ring buffer of RING_SIZE rows:
+row ``seq % RING_SIZE`` is overwritten, so the table never grows past that.
+"""
+import sqlite3
+from array import array
+from datetime import datetime, timedelta
+
+RING_SIZE = 50000
+BATCH_SIZE = 30
+FLUSH_INTERVAL = timedelta(minutes=5)
+
+def ensure_schema(cursor):
+    """Create the raw_signal_captures table if it does not exist."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS raw_signal_captures (
+            slot INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            machine_id TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            sample_period REAL NOT NULL,
+            sample_count INTEGER NOT NULL,
+            lamp_first INTEGER,
+            lamp_runs BLOB,
+            switch_first INTEGER,
+            switch_runs BLOB
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_raw_signal_captures_machine_time
+        ON raw_signal_captures(machine_id, start_time)
+    """)
+
+def encode_runs(samples):
+    """Encode 0/1 samples as (first_value, run lengths as bytes)."""
+    if not samples:
+        return None, b""
+    runs = array('H')
+    current = bool(samples[0])
+    length = 0
+    for sample in samples:
+        sample = bool(sample)
+        if sample == current and length < 0xFFFF:
+            length += 1
+        else:
+            runs.append(length)
+            # A run capped at 0xFFFF continues as a new run of the same value
+            # after a zero-length run of the other one
+            if sample == current:
+                runs.append(0)
+            current = sample
+            length = 1
+    runs.append(length)
+    return int(bool(samples[0])), runs.tobytes()
+
+def decode_runs(first_value, runs_blob):
+    """Decode to a list of (value, run length) pairs."""
+    if first_value is None:
+        return []
+    runs = array('H')
+    runs.frombytes(runs_blob)
+    value = first_value
+    segments = []
+    for length in runs:
+        if length:
+            segments.append((value, length))
+        value = 1 - value
+    return segments
+
+def segments_with_times(start_time, sample_period, first_value, runs_blob):
+    """Decode a stream to [{"start", "end", "value"}] segments for plotting."""
+    segments = []
+    offset = 0
+    for value, length in decode_runs(first_value, runs_blob):
+        segment_start = start_time + timedelta(seconds=offset * sample_period)
+        offset += length
+        segments.append({
+            "start": segment_start.isoformat(),
+            "end": (start_time + timedelta(seconds=offset * sample_period)).isoformat(),
+            "value": value,
+        })
+    return segments
+
+class RawCaptureBuffer:
+    """Collects captures in memory and writes them to the ring in batches."""
+
+    def __init__(self, connect, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, ring_size=RING_SIZE):
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ring_size = ring_size
+        self.pending = []
+        self.last_flush = datetime.now()
+        self.next_seq = None
+
+    def add(self, machine_id, start_time, end_time, lamp_samples, switch_samples):
+        """Queue one capture; samples are the logical (post-inversion) values."""
+        count = len(lamp_samples)
+        if count == 0:
+            return
+        sample_period = (end_time - start_time).total_seconds() / count
+        lamp_first, lamp_runs = encode_runs(lamp_samples)
+        switch_first, switch_runs = encode_runs(switch_samples)
+        if len(self.pending) >= self.batch_size * 10:
+            # The database has been unwritable for a while; keep memory bounded
+            self.pending.pop(0)
+        self.pending.append((machine_id, start_time.isoformat(), sample_period, count,
+                             lamp_first, lamp_runs, switch_first, switch_runs))
+
+    def flush_if_due(self):
+        """Write the batch when it is full or old enough."""
+        if len(self.pending) >= self.batch_size or (
+                self.pending and datetime.now() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write all queued captures in one transaction."""
+        if not self.pending:
+            return
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            ensure_schema(cursor)
+            if self.next_seq is None:
+                cursor.execute("SELECT MAX(seq) FROM raw_signal_captures")
+                last_seq = cursor.fetchone()[0]
+                self.next_seq = 0 if last_seq is None else last_seq + 1
+            rows = []
+            for offset, capture in enumerate(self.pending):
+                seq = self.next_seq + offset
+                rows.append((seq % self.ring_size, seq) + capture)
+            cursor.executemany("""
+                INSERT OR REPLACE INTO raw_signal_captures
+                (slot, seq, machine_id, start_time, sample_period, sample_count,
+                 lamp_first, lamp_runs, switch_first, switch_runs)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self.next_seq += len(self.pending)
+        self.pending = []
+        self.last_flush = datetime.now()
+
+def fetch_window(cursor, machine_id, start, end, limit=1000):
+    """Captures of one machine that started in [start, end), oldest first."""
+    cursor.execute("""
+        SELECT start_time, sample_period, sample_count,
+               lamp_first, lamp_runs, switch_first, switch_runs
+        FROM raw_signal_captures
+        WHERE machine_id = ? AND start_time >= ? AND start_time < ?
+        ORDER BY start_time
+        LIMIT ?
+    """, (machine_id, start.isoformat(), end.isoformat(), limit))
+    captures = []
+    for start_time, sample_period, sample_count, lamp_first, lamp_runs, switch_first, switch_runs in cursor.fetchall():
+        capture_start = datetime.fromisoformat(start_time)
+        captures.append({
+            "start": start_time,
+            "sample_period": sample_period,
+            "sample_count": sample_count,
+            "lamp": segments_with_times(capture_start, sample_period, lamp_first, lamp_runs),
+            "switch": segments_with_times(capture_start, sample_period, switch_first, switch_runs),
+        })
+    return captures
@@ -0,0 +1,275 @@
+"""Recompute per-day durations and derived tables from machine_events.
+
+Repairs ``timeline_slots`` for a range of days and, when the range includes
+today, the running totals in ``machine_runtime`` for the current shift.
+Safe to run while the collector and the web interface are live.
+
+Usage:
+    python recompute.py --from 2025-06-01 --to 2025-06-30 [--workers 4]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+import timeline_pyramid
+
+DATABASE_FILE = os.environ.get('KANSHI_DATABASE', '/home/reigicad/KoukiKanshi/machine_monitoring.db')
+MACHINE_IDS = ["GRS_14", "GRS_17", "GRS_19"]
+BUSY_TIMEOUT = 30
+
+def _day_bounds(day):
+    midnight = datetime.combine(day, datetime.min.time())
+    return (midnight.replace(hour=timeline_pyramid.WORKDAY_START_HOUR),
+            midnight.replace(hour=timeline_pyramid.WORKDAY_END_HOUR))
+
+def _machine_intervals(cursor, machine_id, day):
+    """Closed status intervals of one machine, clipped to the day's working hours.
+
+    Each event's status lasts until the next event; the state carried in from
+    before 06:00 counts from 06:00. The latest event of all is still in
+    progress and is left out, as the collector only counts it once it ends.
+    Returns (intervals, latest, closed): latest is the machine's last
+    (timestamp, status) up to the end of the day, or None, and closed tells
+    whether an event after the day already ended that state.
+    """
+    day_start, day_end = _day_bounds(day)
+    cursor.execute("""
+        SELECT timestamp, status FROM machine_events
+        WHERE machine_id = ? AND timestamp < ?
+        ORDER BY timestamp DESC LIMIT 1
+    """, (machine_id, day_start.isoformat()))
+    events = cursor.fetchall()
+    cursor.execute("""
+        SELECT timestamp, status FROM machine_events
+        WHERE machine_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp
+    """, (machine_id, day_start.isoformat(), day_end.isoformat()))
+    events.extend(cursor.fetchall())
+    latest = (datetime.fromisoformat(events[-1][0]), events[-1][1]) if events else None
+    cursor.execute("""
+        SELECT timestamp, status FROM machine_events
+        WHERE machine_id = ? AND timestamp >= ?
+        ORDER BY timestamp LIMIT 1
+    """, (machine_id, day_end.isoformat()))
+    following = cursor.fetchall()
+    events.extend(following)
+
+    intervals = []
+    previous = None
+    for timestamp, status in events:
+        timestamp = datetime.fromisoformat(timestamp)
+        if previous is not None:
+            start, end = max(previous[0], day_start), min(timestamp, day_end)
+            if start < end:
+                intervals.append((previous[1], start, end))
+        previous = (timestamp, status)
+    return intervals, latest, bool(following)
+
+def _split_minutes(start, end):
+    """Yield (minute, seconds) for [start, end), given in seconds since midnight."""
+    minute = int(start // 60)
+    while minute * 60 < end:
+        seconds = min(end, minute * 60 + 60) - max(start, minute * 60)
+        if seconds > 0:
+            yield minute, seconds
+        minute += 1
+
+def _build_levels(midnight, minutes):
+    """Sum per-minute seconds into every resolution level.
+
+    All levels are whole multiples of a minute, so each minute falls in
+    exactly one slot per level.
+    """
+    slots = {}
+    for resolution in timeline_pyramid.RESOLUTIONS:
+        keys = {}
+        for minute, seconds in minutes.items():
+            slot_minute = minute // resolution * resolution
+            key = keys.get(slot_minute)
+            if key is None:
+                key = keys[slot_minute] = (resolution, (midnight + timedelta(minutes=slot_minute)).isoformat())
+                slots[key] = dict.fromkeys(timeline_pyramid.STATUSES, 0.0)
+            slot = slots[key]
+            for status, value in seconds.items():
+                slot[status] += value
+    return slots
+
+def compute_day(cursor, day, machine_ids=MACHINE_IDS):
+    """Durations and timeline slots for one day, in a single pass per machine.
+
+    Intervals are split into 1-minute slots once; the coarser levels are
+    built from those.
+
+    Returns {machine_id: {"durations": {status: seconds},
+    "slots": {(resolution, slot_start): {status: seconds}}, "latest": ...,
+    "closed": ...}}.
+    """
+    midnight = datetime.combine(day, datetime.min.time())
+    result = {}
+    for machine_id in machine_ids:
+        intervals, latest, closed = _machine_intervals(cursor, machine_id, day)
+        durations = dict.fromkeys(timeline_pyramid.STATUSES, 0.0)
+        minutes = {}
+        for status, start, end in intervals:
+            status = status if status in timeline_pyramid.STATUS_COLUMNS else "Unknown"
+            durations[status] += (end - start).total_seconds()
+            # Intervals are already clipped to the day's working hours
+            for minute, seconds in _split_minutes((start - midnight).total_seconds(),
+                                                  (end - midnight).total_seconds()):
+                if minute not in minutes:
+                    minutes[minute] = dict.fromkeys(timeline_pyramid.STATUSES, 0.0)
+                minutes[minute][status] += seconds
+        result[machine_id] = {"durations": durations, "slots": _build_levels(midnight, minutes),
+                              "latest": latest, "closed": closed}
+    return result
+
+def _compute_day_worker(database_file, day, machine_ids):
+    """Process-pool entry point: compute one day on a read-only connection."""
+    with closing(sqlite3.connect(f"file:{database_file}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM machine_events")
+        seq = cursor.fetchone()[0] or 0
+        return day, seq, compute_day(cursor, day, machine_ids)
+
+def _is_stale(cursor, day, seq, computed):
+    """True if events logged after ``seq`` can change the day's result.
+
+    That is any new event up to the end of the day, or any new event at all
+    while some machine's last state of the day was still open.
+    """
+    _, day_end = _day_bounds(day)
+    if all(data["closed"] for data in computed.values()):
+        cursor.execute("""
+            SELECT 1 FROM machine_events WHERE id > ? AND timestamp < ? LIMIT 1
+        """, (seq, day_end.isoformat()))
+    else:
+        cursor.execute("SELECT 1 FROM machine_events WHERE id > ? LIMIT 1", (seq,))
+    return cursor.fetchone() is not None
+
+def _write_day(cursor, day, machine_ids, computed):
+    """Replace the day's timeline slots with the recomputed ones."""
+    midnight = datetime.combine(day, datetime.min.time())
+    cursor.execute(f"""
+        DELETE FROM timeline_slots
+        WHERE machine_id IN ({','.join('?' * len(machine_ids))})
+        AND slot_start >= ? AND slot_start < ?
+    """, (*machine_ids, midnight.isoformat(), (midnight + timedelta(days=1)).isoformat()))
+    rows = []
+    for machine_id, data in computed.items():
+        for (resolution, slot_start), seconds in data["slots"].items():
+            rows.append((machine_id, resolution, slot_start,
+                         *(seconds[status] for status in timeline_pyramid.STATUSES)))
+    cursor.executemany("""
+        INSERT INTO timeline_slots
+        (machine_id, resolution, slot_start, off_seconds, prep_seconds, on_seconds, unknown_seconds)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+def _repair_runtime(cursor, day, computed):
+    """Rewrite machine_runtime for the current shift from the recomputed day."""
+    day_start, _ = _day_bounds(day)
+    for machine_id, data in computed.items():
+        latest = data["latest"]
+        if latest is None:
+            continue
+        status, start_time = latest[1], latest[0]
+        durations = data["durations"]
+        if start_time < day_start:
+            # Nothing logged yet this shift: same state as right after the reset
+            start_time = day_start
+        cursor.execute("""
+            UPDATE machine_runtime
+            SET current_status = ?,
+                current_start_time = ?,
+                off_duration = ?,
+                prep_duration = ?,
+                on_duration = ?,
+                unknown_duration = ?
+            WHERE machine_id = ?
+        """, (status, start_time.isoformat(),
+              durations["Off"], durations["Prep"], durations["On"], durations["Unknown"],
+              machine_id))
+
+def recompute(start_day, end_day, machine_ids=MACHINE_IDS, workers=1,
+              repair_runtime=True, database_file=DATABASE_FILE):
+    """Recompute durations and timeline slots for every day in [start_day, end_day].
+
+    Days are computed independently (in ``workers`` processes when > 1) on
+    read-only connections, then written one day per short transaction. A day
+    that received new events while it was being computed is recomputed
+    inside its write transaction, which holds the database write lock, so
+    nothing the collector logs meanwhile is lost.
+
+    When the range includes today and repair_runtime is set, machine_runtime
+    is rebuilt for the current shift in the same transaction.
+
+    Returns {day: {machine_id: {status: seconds}}}.
+    """
+    days = [start_day + timedelta(days=i) for i in range((end_day - start_day).days + 1)]
+    today = date.today()
+    totals = {}
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_compute_day_worker, [database_file] * len(days), days,
+                                    [machine_ids] * len(days)))
+    else:
+        results = [_compute_day_worker(database_file, day, machine_ids) for day in days]
+
+    with closing(sqlite3.connect(database_file, timeout=BUSY_TIMEOUT, isolation_level=None)) as conn:
+        cursor = conn.cursor()
+        timeline_pyramid.ensure_schema(cursor)
+        for day, seq, computed in results:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                if _is_stale(cursor, day, seq, computed):
+                    computed = compute_day(cursor, day, machine_ids)
+                _write_day(cursor, day, machine_ids, computed)
+                if repair_runtime and day == today:
+                    _repair_runtime(cursor, day, computed)
+                cursor.execute("COMMIT")
+            except sqlite3.Error:
+                cursor.execute("ROLLBACK")
+                raise
+            totals[day] = {machine_id: data["durations"] for machine_id, data in computed.items()}
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute durations and timeline slots from machine_events.")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, default=date.today(),
+                        help="first day (YYYY-MM-DD), default today")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, default=None,
+                        help="last day (YYYY-MM-DD), default same as --from")
+    parser.add_argument("--machine", action="append", choices=MACHINE_IDS,
+                        help="machine to recompute (repeatable), default all")
+    parser.add_argument("--workers", type=int, default=1, help="processes used to compute days")
+    parser.add_argument("--no-runtime", action="store_true",
+                        help="do not rewrite machine_runtime for today")
+    parser.add_argument("--database", default=DATABASE_FILE)
+    args = parser.parse_args(argv)
+
+    end = args.end or args.start
+    if end < args.start:
+        parser.error("--to must not be before --from")
+
+    started = datetime.now()
+    try:
+        totals = recompute(args.start, end, args.machine or MACHINE_IDS, args.workers,
+                           not args.no_runtime, args.database)
+    except sqlite3.Error as e:
+        print(f"Error during recompute: {e}")
+        return 1
+
+    for day, machines in totals.items():
+        for machine_id, durations in machines.items():
+            summary = ", ".join(f"{status} {seconds / 3600:.2f}h" for status, seconds in durations.items())
+            print(f"{day} {machine_id}: {summary}")
+    print(f"Recomputed {len(totals)} day(s) in {(datetime.now() - started).total_seconds():.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
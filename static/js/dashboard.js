@@ -11,6 +11,13 @@ const statusMap = {
 // Active timers tracking
 let activeTimers = {};
 
+// Delta sync: number of 5-minute timeline slots, the client's copy of each
+// machine's slots and the sync state echoed back to /update_conditions
+const TIMELINE_SLOTS = 144;
+const timelineStates = {};
+const renderedIntervals = {};
+let syncState = null;
+
 // Server time offset and sync variables
 let serverTimeOffset = 0;
 let lastServerSync = 0;
@@ -39,12 +46,15 @@ function initTimelines() {
         const timeline = document.getElementById(`${machine}-timeline`);
         timeline.innerHTML = '';
 
-        for (let i = 0; i < 144; i++) {
+        for (let i = 0; i < TIMELINE_SLOTS; i++) {
             const block = document.createElement('div');
             block.className = 'timeline-block block-inactive';
             block.dataset.interval = i;
             timeline.appendChild(block);
         }
+
+        timelineStates[machine] = new Array(TIMELINE_SLOTS).fill(null);
+        renderedIntervals[machine] = null;
     });
 }
 
@@ -56,65 +66,95 @@ function formatDuration(seconds) {
     return '' + String(hrs).padStart(2, '0') + ':' + String(mins).padStart(2, '0') + ':' + String(secs).padStart(2, '0');
 }
 
-// Update timeline display
-function updateTimeline(machineId, timelineData) {
+// Calculate current interval (number of 5-minute blocks since 6 AM), -1 before 6 AM
+function getCurrentInterval() {
+    const now = new Date();
+    if (now.getHours() < 6) return -1;
+    return Math.floor(((now.getHours() - 6) * 60 + now.getMinutes()) / 5);
+}
+
+// Write a block's class and opacity only when they actually change
+function renderBlock(block, className, opacity) {
+    if (block.className !== className) block.className = className;
+    if (block.style.opacity !== opacity) block.style.opacity = opacity;
+}
+
+// Update timeline display. Only the blocks listed in changedIndices are
+// repainted (all blocks when it is omitted), plus the blocks affected by
+// the current interval moving on.
+function updateTimeline(machineId, changedIndices) {
     const timeline = document.getElementById(`${machineId}-timeline`);
     if (!timeline) return;
 
-    const blocks = timeline.querySelectorAll('.timeline-block');
+    const blocks = timeline.children;
     if (!blocks || blocks.length === 0) {
         console.error(`No timeline blocks found for ${machineId}`);
         return;
     }
 
-    const now = new Date();
-    const currentHour = now.getHours();
-    const currentMinute = now.getMinutes();
-
-    // Reset only future blocks at the start of each day before 6 AM
-    if (currentHour < 6) {
-        blocks.forEach(block => {
-            block.className = 'timeline-block block-inactive';
-            block.style.opacity = '0.3';
-        });
-        return;
-    }
-
-    // Calculate current interval (number of 5-minute blocks since 6 AM)
-    const currentInterval = Math.floor(((currentHour - 6) * 60 + currentMinute) / 5);
+    const timelineData = timelineStates[machineId];
+    const currentInterval = getCurrentInterval();
 
     // Get the current machine status
     const currentStatus = machineStates[machineId]?.currentState?.toLowerCase() || 'inactive';
 
-    // Process each block up to the current time
-    for (let i = 0; i < blocks.length; i++) {
+    let indices;
+    if (!changedIndices) {
+        indices = Array.from({ length: blocks.length }, (_, i) => i);
+    } else {
+        indices = new Set(changedIndices);
+        const previousInterval = renderedIntervals[machineId];
+        if (previousInterval !== currentInterval) {
+            // Blocks between the old and new current interval change role
+            const from = Math.max(0, Math.min(previousInterval ?? 0, currentInterval));
+            const to = Math.min(blocks.length - 1, Math.max(previousInterval ?? blocks.length - 1, currentInterval));
+            for (let i = from; i <= to; i++) indices.add(i);
+        }
+        if (currentInterval >= 0 && currentInterval < blocks.length) {
+            indices.add(currentInterval);
+        }
+    }
+    renderedIntervals[machineId] = currentInterval;
+
+    indices.forEach(i => {
         const block = blocks[i];
-        
-        if (i <= currentInterval) {
-            // Get the historical status for this block from timelineData
+        if (!block) return;
+
+        if (i < currentInterval) {
+            // Always use the historical status for past blocks
             const historicalStatus = timelineData[i] ? timelineData[i].toLowerCase() : 'inactive';
-            
-            // For past blocks (before current interval)
-            if (i < currentInterval) {
-                // Always use the historical status for past blocks
-                block.className = `timeline-block block-${historicalStatus}`;
-                block.style.opacity = '1';
-            } 
-            // For the current interval
-            else if (i === currentInterval) {
-                // Use current status for the current block
-                block.className = `timeline-block block-${currentStatus} block-current`;
-                block.style.opacity = '1';
-            }
+            renderBlock(block, `timeline-block block-${historicalStatus}`, '1');
+        } else if (i === currentInterval) {
+            // Use current status for the current block
+            renderBlock(block, `timeline-block block-${currentStatus} block-current`, '1');
         } else {
-            // Future blocks
-            block.className = 'timeline-block block-inactive';
-            block.style.opacity = '0.3';
+            // Future blocks (all blocks before 6 AM)
+            renderBlock(block, 'timeline-block block-inactive', '0.3');
         }
+    });
+}
+
+// Replace a machine's timeline with a full server copy
+function setTimelineData(machineId, timelineData) {
+    timelineStates[machineId] = timelineData.slice(0, TIMELINE_SLOTS);
+    while (timelineStates[machineId].length < TIMELINE_SLOTS) {
+        timelineStates[machineId].push(null);
     }
+    updateTimeline(machineId);
+}
 
-    // Debug output
-    console.log(`Timeline update for ${machineId}:`, timelineData.slice(0, currentInterval + 1));
+// Patch the slots sent in a delta update and repaint only those blocks
+function applyTimelineUpdate(machineId, update) {
+    const timelineData = timelineStates[machineId];
+    const changed = [];
+    update.slots.forEach((status, offset) => {
+        const i = update.from + offset;
+        if (i < TIMELINE_SLOTS && timelineData[i] !== status) {
+            timelineData[i] = status;
+            changed.push(i);
+        }
+    });
+    updateTimeline(machineId, changed);
 }
 
 // Add function to check working hours
@@ -202,30 +242,42 @@ function updateMachineCurrentTime() {
     });
 }
 
+// Build the /update_conditions URL, asking for a delta when we hold a synced copy
+function buildUpdateUrl() {
+    if (!syncState) return '/update_conditions';
+    const params = new URLSearchParams({
+        since: syncState.seq,
+        slot: syncState.slot,
+        epoch: syncState.epoch
+    });
+    return `/update_conditions?${params}`;
+}
+
 // Update machine conditions from server
 async function updateMachineConditions() {
     try {
         const requestStart = Date.now();
-        const response = await fetch('/update_conditions');
+        const response = await fetch(buildUpdateUrl());
         const responseTime = Date.now() - requestStart;
         
         if (!response.ok) throw new Error('Network response was not ok');
         const data = await response.json();
 
         // Store server time information
-        const serverTime = new Date(data.debug_info.current_time);
+        const serverTime = new Date(data.server_time);
         lastKnownServerTime = serverTime.getTime();
         lastServerSync = Date.now();
 
-        // Log timing information
-        console.log('Time sync info:', {
-            server_time: serverTime.toISOString(),
-            client_time: new Date().toISOString(),
-            response_time_ms: responseTime,
-            last_sync_age_ms: Date.now() - lastServerSync
-        });
+        if (data.sync.full) {
+            // Log timing information
+            console.log('Time sync info:', {
+                server_time: serverTime.toISOString(),
+                client_time: new Date().toISOString(),
+                response_time_ms: responseTime
+            });
+        }
 
-        if (data.machine_conditions && data.total_durations && data.timeline_data) {
+        if (data.machine_conditions && data.total_durations) {
             // If this is a reset, clear all existing timers
             if (data.just_reset) {
                 Object.keys(activeTimers).forEach(machine => {
@@ -237,13 +289,14 @@ async function updateMachineConditions() {
                 console.log('Reset detected, cleared all timers');
             }
 
-            // Update each machine's state
+            // Update each machine's state; a delta only lists machines with new events
             Object.entries(data.machine_conditions).forEach(([machine, condition]) => {
                 const statusElement = document.querySelector(`#${machine}-card .machine-status`);
                 if (statusElement) {
                     const japaneseStatus = statusMap[condition.toUpperCase()] || "不明";
-                    statusElement.textContent = japaneseStatus;
-                    statusElement.className = `machine-status status-${condition.toLowerCase()}`;
+                    if (statusElement.textContent !== japaneseStatus) statusElement.textContent = japaneseStatus;
+                    const statusClass = `machine-status status-${condition.toLowerCase()}`;
+                    if (statusElement.className !== statusClass) statusElement.className = statusClass;
                 }
 
                 if (machineStates[machine]) {
@@ -254,14 +307,25 @@ async function updateMachineConditions() {
                         updateDisplayedTimes(machine, data.total_durations[machine], lastKnownServerTime);
                     }
                 }
+            });
 
+            Object.keys(machineStates).forEach(machine => {
                 if (data.timeline_data && data.timeline_data[machine]) {
-                    updateTimeline(machine, data.timeline_data[machine]);
+                    setTimelineData(machine, data.timeline_data[machine]);
+                } else if (data.timeline_updates && data.timeline_updates[machine]) {
+                    applyTimelineUpdate(machine, data.timeline_updates[machine]);
+                } else {
+                    // Nothing new from the server; still roll the current block over
+                    updateTimeline(machine, []);
                 }
             });
         }
+
+        syncState = data.sync;
     } catch (error) {
         console.error('Error updating machine conditions:', error);
+        // Start again from a full snapshot on the next poll
+        syncState = null;
     }
 }
 
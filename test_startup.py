@@ -0,0 +1,10 @@
+"""Startup time and memory budget of the web interface (see check_startup.py)."""
+from check_startup import MAX_RSS_MB, MAX_SECONDS, measure
+
+
+def test_startup_within_budget():
+    result = measure()
+    assert result["scheduler"], "scheduler did not start"
+    assert not result["pandas"], "pandas imported on startup"
+    assert result["seconds"] <= MAX_SECONDS
+    assert result["rss_mb"] <= MAX_RSS_MB
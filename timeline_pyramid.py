@@ -0,0 +1,188 @@
+"""Precomputed multi-resolution timeline slots.
+
+For every machine, ``timeline_slots`` holds how many seconds were spent in
+each status per slot, at 1, 5, 15 and 60 minute and daily resolution. The
+data collector adds each finished status interval as it logs the next
+reading, so reading a zoom level never touches ``machine_events``.
+
+Only working hours (06:00-18:00) are counted, matching the dashboard.
+Levels finer than daily are only kept for FINE_RETENTION.
+"""
+import math
+from datetime import timedelta
+
+# Slot sizes in minutes, finest first; 1440 is the daily level
+RESOLUTIONS = (1, 5, 15, 60, 1440)
+DAILY = 1440
+
+WORKDAY_START_HOUR = 6
+WORKDAY_END_HOUR = 18
+
+# The collector deletes finer-than-daily slots older than this
+FINE_RETENTION = timedelta(days=30)
+
+STATUS_COLUMNS = {
+    "Off": "off_seconds",
+    "Prep": "prep_seconds",
+    "On": "on_seconds",
+    "Unknown": "unknown_seconds",
+}
+STATUSES = tuple(STATUS_COLUMNS)
+
+def ensure_schema(cursor):
+    """Create the timeline_slots table if it does not exist."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS timeline_slots (
+            machine_id TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            slot_start TEXT NOT NULL,
+            off_seconds REAL DEFAULT 0,
+            prep_seconds REAL DEFAULT 0,
+            on_seconds REAL DEFAULT 0,
+            unknown_seconds REAL DEFAULT 0,
+            PRIMARY KEY (machine_id, resolution, slot_start)
+        ) WITHOUT ROWID
+    """)
+
+def slot_floor(timestamp, resolution):
+    """Start of the slot containing timestamp."""
+    midnight = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution >= DAILY:
+        return midnight
+    minutes = (timestamp.hour * 60 + timestamp.minute) // resolution * resolution
+    return midnight + timedelta(minutes=minutes)
+
+def _working_windows(start, end):
+    """Split [start, end) into its parts that fall inside working hours."""
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        window_start = max(start, day.replace(hour=WORKDAY_START_HOUR))
+        window_end = min(end, day.replace(hour=WORKDAY_END_HOUR))
+        if window_start < window_end:
+            yield window_start, window_end
+        day += timedelta(days=1)
+
+def split_interval(start, end, resolution):
+    """Yield (slot_start, seconds) for the working-hours part of [start, end)."""
+    for window_start, window_end in _working_windows(start, end):
+        slot = slot_floor(window_start, resolution)
+        step = timedelta(minutes=resolution)
+        while slot < window_end:
+            slot_end = slot + step
+            seconds = (min(slot_end, window_end) - max(slot, window_start)).total_seconds()
+            if seconds > 0:
+                yield slot, seconds
+            slot = slot_end
+
+def add_interval(cursor, machine_id, status, start, end):
+    """Add a finished status interval to every resolution level.
+
+    Runs inside the caller's transaction.
+    """
+    if not status or start is None or end <= start:
+        return
+    column = STATUS_COLUMNS.get(status, "unknown_seconds")
+    for resolution in RESOLUTIONS:
+        cursor.executemany(f"""
+            INSERT INTO timeline_slots (machine_id, resolution, slot_start, {column})
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (machine_id, resolution, slot_start)
+            DO UPDATE SET {column} = {column} + excluded.{column}
+        """, [
+            (machine_id, resolution, slot.isoformat(), seconds)
+            for slot, seconds in split_interval(start, end, resolution)
+        ])
+
+def pick_resolution(requested_minutes):
+    """Coarsest stored level that is at least as fine as the requested one."""
+    chosen = RESOLUTIONS[0]
+    for resolution in RESOLUTIONS:
+        if resolution <= requested_minutes:
+            chosen = resolution
+    return chosen
+
+def slot_count(start, end, resolution):
+    """Number of slots of one level that cover [start, end)."""
+    minutes = (end - slot_floor(start, resolution)).total_seconds() / 60
+    return math.ceil(minutes / resolution)
+
+def auto_resolution(start, end, now, target_slots, max_slots):
+    """Level for [start, end) when the client asks for no resolution.
+
+    The coarsest level that still gives at least about target_slots slots
+    (half of it counts), stepping up to coarser levels while the range would
+    need more than max_slots. Ranges reaching back past FINE_RETENTION use
+    the daily level, the only one kept that long.
+    """
+    if start < now - FINE_RETENTION:
+        return DAILY
+    chosen = RESOLUTIONS[0]
+    for resolution in reversed(RESOLUTIONS):
+        if slot_count(start, end, resolution) * 2 >= target_slots:
+            chosen = resolution
+            break
+    for resolution in RESOLUTIONS[RESOLUTIONS.index(chosen):]:
+        chosen = resolution
+        if slot_count(start, end, resolution) <= max_slots:
+            break
+    return chosen
+
+def dominant_status(durations):
+    """Status with the most seconds in a slot, or None for an empty slot."""
+    status = max(STATUSES, key=lambda s: durations[s])
+    return status if durations[status] > 0 else None
+
+def fetch_slots(cursor, machine_id, start, end, resolution, open_interval=None):
+    """Read one level as dense arrays over [start, end).
+
+    open_interval is an optional (status, started_at) for the state that is
+    still in progress; it is added up to ``end`` on the fly because the
+    collector only writes intervals once they finish.
+
+    Returns (slot_starts, durations) where durations[i] maps each status to
+    seconds for slot_starts[i].
+    """
+    first = slot_floor(start, resolution)
+    step = timedelta(minutes=resolution)
+    slot_starts = []
+    slot = first
+    while slot < end:
+        slot_starts.append(slot)
+        slot += step
+    index = {slot.isoformat(): i for i, slot in enumerate(slot_starts)}
+    durations = [dict.fromkeys(STATUSES, 0.0) for _ in slot_starts]
+
+    cursor.execute("""
+        SELECT slot_start, off_seconds, prep_seconds, on_seconds, unknown_seconds
+        FROM timeline_slots
+        WHERE machine_id = ? AND resolution = ?
+        AND slot_start >= ? AND slot_start < ?
+        ORDER BY slot_start
+    """, (machine_id, resolution, first.isoformat(), end.isoformat()))
+    for row in cursor.fetchall():
+        i = index.get(row[0])
+        if i is None:
+            continue
+        for status, seconds in zip(STATUSES, row[1:]):
+            durations[i][status] += seconds or 0
+
+    if open_interval and open_interval[0] and open_interval[1]:
+        status, started_at = open_interval
+        status = status if status in STATUS_COLUMNS else "Unknown"
+        for slot, seconds in split_interval(max(started_at, first), end, resolution):
+            i = index.get(slot.isoformat())
+            if i is not None:
+                durations[i][status] += seconds
+
+    return slot_starts, durations
+
+def delete_before(cursor, cutoff, keep_daily=True):
+    """Drop slots older than cutoff; daily slots are kept for long-range views."""
+    if keep_daily:
+        cursor.execute(
+            "DELETE FROM timeline_slots WHERE slot_start < ? AND resolution < ?",
+            (cutoff.isoformat(), DAILY)
+        )
+    else:
+        cursor.execute("DELETE FROM timeline_slots WHERE slot_start < ?", (cutoff.isoformat(),))
+    return cursor.rowcount
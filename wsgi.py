@@ -0,0 +1,4 @@
+"""WSGI entry point for the Kanshi web interface (used by gunicorn)."""
+from Kanshi import create_app
+
+app = create_app()